@@ -5,13 +5,79 @@ Command-line interface for HTML Chunking Library
 import argparse
 import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List
+from typing import Iterator, List, Optional, Tuple
 
 from html_chunking.html_chunking_main import HTMLChunker
 from html_chunking.html_chunking_core import count_tokens
 
 
+def iter_html_files(root: Path) -> Iterator[Path]:
+    """
+    Recursively yield HTML files under a directory in a single walk.
+    
+    Args:
+        root: Directory to search
+    
+    Yields:
+        Paths of .html and .htm files
+    """
+    with os.scandir(root) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from iter_html_files(Path(entry.path))
+            elif entry.is_file() and entry.name.lower().endswith(('.html', '.htm')):
+                yield Path(entry.path)
+
+
+def process_file(
+    html_file: Path,
+    chunker: HTMLChunker,
+    output_path: Path,
+    prefix: str,
+    model: str
+) -> Tuple[int, List[int], Optional[str], Path]:
+    """
+    Read, chunk and save a single HTML file.
+    
+    Args:
+        html_file: HTML file to process
+        chunker: Configured chunker instance
+        output_path: Directory in which the file's chunk folder is created
+        prefix: Prefix for chunk filenames
+        model: Tokenizer model used for statistics
+    
+    Returns:
+        Tuple of (input_tokens, chunk_tokens, removed_content, file_output_dir)
+    """
+    # Read HTML content
+    with open(html_file, 'r', encoding='utf-8') as f:
+        html_content = f.read()
+    
+    # Count original tokens
+    input_tokens = count_tokens(html_content, model)
+    
+    # Create output subdirectory for this file
+    file_output_dir = output_path / html_file.stem
+    file_output_dir.mkdir(exist_ok=True)
+    
+    # Save chunks as they are produced
+    chunk_tokens = []
+    for i, chunk in enumerate(chunker.iter_chunks(html_content)):
+        chunk_filename = f"{prefix}{i:03d}.html"
+        chunk_path = file_output_dir / chunk_filename
+        
+        with open(chunk_path, 'w', encoding='utf-8') as f:
+            f.write(chunk)
+        
+        chunk_tokens.append(count_tokens(chunk, model))
+    
+    removed_content = chunker.get_last_removed_content() if chunker.clean_html else None
+    
+    return input_tokens, chunk_tokens, removed_content, file_output_dir
+
+
 def main():
     """Main CLI entry point."""
     parser = argparse.ArgumentParser(
@@ -61,6 +127,19 @@ def main():
         help="Prefix for chunk filenames (default: chunk_)"
     )
     
+    parser.add_argument(
+        "--optimal-merge",
+        action="store_true",
+        help="Minimize the number of chunks instead of merging greedily (slower)"
+    )
+    
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of files to process in parallel (default: CPU count)"
+    )
+    
     parser.add_argument(
         "-v", "--verbose",
         action="store_true",
@@ -90,7 +169,8 @@ def main():
         max_tokens=args.max_tokens,
         clean_html=not args.no_clean,
         attr_cutoff_len=args.attr_cutoff,
-        model=args.model
+        model=args.model,
+        optimal_merge=args.optimal_merge
     )
     
     # Process files
@@ -102,7 +182,7 @@ def main():
             print(f"Error: '{args.input}' is not an HTML file")
             sys.exit(1)
     elif input_path.is_dir():
-        html_files = list(input_path.glob('**/*.html')) + list(input_path.glob('**/*.htm'))
+        html_files = list(iter_html_files(input_path))
         if not html_files:
             print(f"No HTML files found in '{args.input}'")
             sys.exit(1)
@@ -118,56 +198,38 @@ def main():
     total_input_tokens = 0
     total_output_tokens = 0
     
-    for html_file in html_files:
-        if args.verbose:
-            print(f"Processing: {html_file}")
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        futures = [
+            executor.submit(process_file, html_file, chunker, output_path, args.prefix, args.model)
+            for html_file in html_files
+        ]
         
-        try:
-            # Read HTML content
-            with open(html_file, 'r', encoding='utf-8') as f:
-                html_content = f.read()
-            
-            # Count original tokens
-            input_tokens = count_tokens(html_content, args.model)
-            total_input_tokens += input_tokens
-            
-            # Process chunks
-            chunks, removed_content = chunker.chunk_with_metadata(html_content)
-            
-            # Create output subdirectory for this file
-            file_output_dir = output_path / html_file.stem
-            file_output_dir.mkdir(exist_ok=True)
+        for html_file, future in zip(html_files, futures):
+            if args.verbose:
+                print(f"Processing: {html_file}")
             
-            # Save chunks
-            chunk_tokens = []
-            for i, chunk in enumerate(chunks):
-                chunk_filename = f"{args.prefix}{i:03d}.html"
-                chunk_path = file_output_dir / chunk_filename
+            try:
+                input_tokens, chunk_tokens, removed_content, file_output_dir = future.result()
                 
-                with open(chunk_path, 'w', encoding='utf-8') as f:
-                    f.write(chunk)
+                total_input_tokens += input_tokens
+                total_output_tokens += sum(chunk_tokens)
+                total_chunks += len(chunk_tokens)
                 
-                tokens = count_tokens(chunk, args.model)
-                chunk_tokens.append(tokens)
-                total_output_tokens += tokens
-            
-            total_chunks += len(chunks)
-            
-            if args.verbose:
-                print(f"  Created {len(chunks)} chunks in {file_output_dir}")
-                if removed_content:
-                    print(f"  Removed {len(removed_content)} chars of scripts/styles")
+                if args.verbose:
+                    print(f"  Created {len(chunk_tokens)} chunks in {file_output_dir}")
+                    if removed_content:
+                        print(f"  Removed {len(removed_content)} chars of scripts/styles")
+                
+                if args.stats:
+                    print(f"  Input tokens: {input_tokens:,}")
+                    print(f"  Output tokens: {sum(chunk_tokens):,}")
+                    print(f"  Avg tokens per chunk: {sum(chunk_tokens)//len(chunk_tokens)}")
+                    print(f"  Token range: {min(chunk_tokens)} - {max(chunk_tokens)}")
+                    print()
             
-            if args.stats:
-                print(f"  Input tokens: {input_tokens:,}")
-                print(f"  Output tokens: {sum(chunk_tokens):,}")
-                print(f"  Avg tokens per chunk: {sum(chunk_tokens)//len(chunk_tokens)}")
-                print(f"  Token range: {min(chunk_tokens)} - {max(chunk_tokens)}")
-                print()
-        
-        except Exception as e:
-            print(f"Error processing {html_file}: {e}")
-            continue
+            except Exception as e:
+                print(f"Error processing {html_file}: {e}")
+                continue
     
     # Final statistics
     print(f"✅ Processing complete!")
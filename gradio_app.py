@@ -5,8 +5,26 @@ Gradio web interface for HTML Chunking Library
 import gradio as gr
 import tempfile
 import os
+import zipfile
+from functools import lru_cache
 from typing import List, Tuple
-from html_chunking import get_html_chunks, HTMLChunker, count_tokens
+from html_chunking import HTMLChunker, count_tokens, count_tokens_batch
+
+
+@lru_cache(maxsize=32)
+def _get_chunker(
+    max_tokens: int,
+    clean_html: bool,
+    attr_cutoff_len: int,
+    model: str = "gpt-3.5-turbo"
+) -> HTMLChunker:
+    """Return a shared chunker for the given settings."""
+    return HTMLChunker(
+        max_tokens=max_tokens,
+        clean_html=clean_html,
+        attr_cutoff_len=attr_cutoff_len,
+        model=model
+    )
 
 
 def process_html_text(
@@ -20,11 +38,11 @@ def process_html_text(
         return "", "Please enter some HTML content.", ""
     
     try:
-        # Create chunker instance
-        chunker = HTMLChunker(
-            max_tokens=max_tokens,
-            clean_html=clean_html,
-            attr_cutoff_len=attr_cutoff_len if attr_cutoff_len > 0 else 40
+        # Reuse chunker instance for these settings
+        chunker = _get_chunker(
+            max_tokens,
+            clean_html,
+            attr_cutoff_len if attr_cutoff_len > 0 else 40
         )
         
         # Process chunks with metadata
@@ -32,13 +50,13 @@ def process_html_text(
         
         # Calculate statistics
         original_tokens = count_tokens(html_text)
-        total_chunk_tokens = sum(count_tokens(chunk) for chunk in chunks)
+        chunk_tokens = count_tokens_batch(chunks)
+        total_chunk_tokens = sum(chunk_tokens)
         
         # Format output
         chunk_output = ""
         for i, chunk in enumerate(chunks):
-            chunk_tokens = count_tokens(chunk)
-            chunk_output += f"=== CHUNK {i+1} ({chunk_tokens} tokens) ===\n"
+            chunk_output += f"=== CHUNK {i+1} ({chunk_tokens[i]} tokens) ===\n"
             chunk_output += chunk
             chunk_output += "\n\n"
         
@@ -49,8 +67,8 @@ def process_html_text(
 - Number of chunks: {len(chunks)}
 - Total tokens after processing: {total_chunk_tokens:,}
 - Average tokens per chunk: {total_chunk_tokens//len(chunks) if chunks else 0}
-- Max tokens per chunk: {max(count_tokens(chunk) for chunk in chunks) if chunks else 0}
-- Min tokens per chunk: {min(count_tokens(chunk) for chunk in chunks) if chunks else 0}
+- Max tokens per chunk: {max(chunk_tokens) if chunks else 0}
+- Min tokens per chunk: {min(chunk_tokens) if chunks else 0}
 """
         
         # Removed content info
@@ -100,28 +118,18 @@ def download_chunks(
         return None
     
     try:
-        chunks = get_html_chunks(
-            html=html_text,
-            max_tokens=max_tokens,
-            is_clean_html=clean_html,
-            attr_cutoff_len=attr_cutoff_len if attr_cutoff_len > 0 else 40
+        chunker = _get_chunker(
+            max_tokens,
+            clean_html,
+            attr_cutoff_len if attr_cutoff_len > 0 else 40
         )
+        chunks = chunker.chunk(html_text)
         
-        # Create temporary directory for chunks
-        temp_dir = tempfile.mkdtemp()
-        
-        for i, chunk in enumerate(chunks):
-            chunk_file = os.path.join(temp_dir, f'chunk_{i:03d}.html')
-            with open(chunk_file, 'w', encoding='utf-8') as f:
-                f.write(chunk)
-        
-        # Create ZIP file
-        import zipfile
-        zip_path = os.path.join(temp_dir, 'html_chunks.zip')
-        with zipfile.ZipFile(zip_path, 'w') as zipf:
-            for i in range(len(chunks)):
-                chunk_file = os.path.join(temp_dir, f'chunk_{i:03d}.html')
-                zipf.write(chunk_file, f'chunk_{i:03d}.html')
+        # Write chunks straight into the ZIP file
+        zip_path = os.path.join(tempfile.mkdtemp(), 'html_chunks.zip')
+        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED, compresslevel=6) as zipf:
+            for i, chunk in enumerate(chunks):
+                zipf.writestr(f'chunk_{i:03d}.html', chunk)
         
         return zip_path
         
@@ -2,14 +2,48 @@
 Core HTML chunking functionality for splitting large HTML documents into smaller, manageable chunks.
 """
 
+import os
 import tiktoken
-from typing import List, Dict, Any, Tuple
+from functools import lru_cache
+from bs4 import NavigableString, Tag
+from bs4.element import AttributeValueWithCharsetSubstitution
+from bs4.formatter import HTMLFormatter
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+
+
+# Only texts up to this many characters are kept in the token count cache, so
+# it holds small repeated fragments rather than whole documents
+_CACHED_TEXT_MAX_LEN = 2048
+
+# measure_dom overcounts slightly, so nodes measured below this multiple of
+# max_tokens are counted exactly before iter_dom_chunks descends into them
+# (descending drops the node's own text, so an overcount would lose content)
+_MEASURE_CONFIRM_RATIO = 1.25
+
+# Formatter str() uses by default, for serializing tags consistently with it
+_FORMATTER = HTMLFormatter.REGISTRY['minimal']
+
+
+@lru_cache(maxsize=8)
+def _get_encoder(model: str) -> tiktoken.Encoding:
+    """
+    Return the tokenizer for a model, loading it only once per process.
+    
+    Args:
+        model: The model name to get the tokenizer for
+    
+    Returns:
+        Cached tiktoken encoding
+    """
+    return tiktoken.encoding_for_model(model)
 
 
 def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
     """
     Count the number of tokens in a text string using the specified model's tokenizer.
     
+    Special-token markers such as <|endoftext|> are counted as ordinary text.
+    
     Args:
         text: The text to count tokens for
         model: The model name to use for tokenization (default: gpt-3.5-turbo)
@@ -17,11 +51,43 @@ def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
     Returns:
         Number of tokens in the text
     """
-    encoder = tiktoken.encoding_for_model(model)
-    tokens = encoder.encode(text)
+    if len(text) <= _CACHED_TEXT_MAX_LEN:
+        return _count_tokens_cached(text, model)
+    return len(_get_encoder(model).encode_ordinary(text))
+
+
+@lru_cache(maxsize=4096)
+def _count_tokens_cached(text: str, model: str) -> int:
+    """
+    Tokenize short text, remembering recent results so repeated strings are free.
+    
+    Args:
+        text: The text to count tokens for
+        model: The model name to use for tokenization
+    
+    Returns:
+        Number of tokens in the text
+    """
+    encoder = _get_encoder(model)
+    tokens = encoder.encode_ordinary(text)
     return len(tokens)
 
 
+def count_tokens_batch(texts: List[str], model: str = "gpt-3.5-turbo") -> List[int]:
+    """
+    Count tokens for several texts with a single batched tokenizer call.
+    
+    Args:
+        texts: The texts to count tokens for
+        model: The model name to use for tokenization (default: gpt-3.5-turbo)
+    
+    Returns:
+        Number of tokens in each text, in input order
+    """
+    encoder = _get_encoder(model)
+    return [len(tokens) for tokens in encoder.encode_ordinary_batch(texts, num_threads=os.cpu_count() or 1)]
+
+
 def format_attrs(attrs: Dict[str, Any]) -> Dict[str, str]:
     """
     Format HTML attributes, converting lists to space-separated strings.
@@ -32,7 +98,7 @@ def format_attrs(attrs: Dict[str, Any]) -> Dict[str, str]:
     Returns:
         Formatted attributes dictionary
     """
-    formatted_attrs = {}
+    formatted_attrs: Dict[str, str] = {}
     for key, value in attrs.items():
         if isinstance(value, list):
             value = ' '.join(value) if value else ''
@@ -40,70 +106,197 @@ def format_attrs(attrs: Dict[str, Any]) -> Dict[str, str]:
     return formatted_attrs
 
 
-def build_full_content(path: List[Dict[str, Any]], node) -> str:
+def _tag_strings(node: Tag) -> Tuple[str, str]:
+    """
+    Serialize the opening and closing tags of a node the way BeautifulSoup does.
+    
+    Attributes go through BeautifulSoup's default ("minimal") formatter, so
+    their order, escaping and quoting match str(node).
+    
+    Args:
+        node: BeautifulSoup tag
+    
+    Returns:
+        Tuple of (opening_tag, closing_tag); both empty for the document root
+    """
+    if node.parent is None and node.name == '[document]':
+        return '', ''
+    parts: List[str] = []
+    for key, value in _FORMATTER.attributes(node):
+        if value is None:
+            parts.append(' ' + key)
+            continue
+        if isinstance(value, AttributeValueWithCharsetSubstitution):
+            # <meta> charsets are rewritten to the output encoding; the method
+            # is called encode() before beautifulsoup4 4.13
+            substitute_encoding = getattr(value, 'substitute_encoding', None) or getattr(value, 'encode')
+            value = substitute_encoding('utf-8')
+        elif isinstance(value, list):
+            value = ' '.join(value)
+        parts.append(' ' + key + '=' + _FORMATTER.quoted_attribute_value(_FORMATTER.attribute_value(value)))
+    attrs = ''.join(parts)
+    if node.is_empty_element:
+        return "<" + node.name + attrs + "/>", ''
+    return "<" + node.name + attrs + ">", "</" + node.name + ">"
+
+
+def path_frame(node: Tag) -> Dict[str, Any]:
     """
-    Build full HTML content by wrapping node with its parent tags from the path.
+    Describe a parent node for a chunk path, with its tags serialized once.
     
     Args:
-        path: List of parent elements with their tags and attributes
-        node: The current node to wrap
+        node: BeautifulSoup tag being descended into
     
     Returns:
-        Complete HTML string with proper nesting
+        Dictionary with the tag name, formatted attributes and serialized
+        opening and closing tags
+    """
+    opening_tag, closing_tag = _tag_strings(node)
+    return {
+        'tag': node.name,
+        'attrs': format_attrs(node.attrs),
+        'opening_tag': opening_tag,
+        'closing_tag': closing_tag
+    }
+
+
+def measure_dom(root: Tag, model: str = "gpt-3.5-turbo", max_tokens: Optional[int] = None) -> Dict[int, int]:
     """
-    opening_tags = ''.join([
-        "<" + p['tag'] + ''.join([' {}="{}"'.format(key, value) for key, value in p['attrs'].items()]) + ">"
-        for p in path
-    ])
-    node_content = str(node)
-    closing_tags = ''.join(["</" + p['tag'] + ">" for p in reversed(path)])
+    Count tokens for every tag under root in a single bottom-up pass.
+    
+    Each text node is tokenized once and each tag's count is the sum of its
+    children plus its own opening and closing tags, so no subtree is ever
+    re-serialized. Tokens that would merge across sibling boundaries are not
+    accounted for, which makes the counts a slight overestimate; callers
+    deciding to split a node should confirm counts close to the limit.
     
-    full_content = opening_tags + node_content + closing_tags
+    Every token covers at least one byte, so when max_tokens is given and the
+    whole document is smaller than that in UTF-8 bytes, the byte sizes are
+    returned instead without running the tokenizer; they are upper bounds
+    that already show every tag fits.
     
-    # Clean up document markers
-    if full_content.startswith('<[document]>'):
-        full_content = full_content[len('<[document]>'):].strip()
-    if full_content.endswith('</[document]>'):
-        full_content = full_content[:-len('</[document]>')].strip()
+    Args:
+        root: BeautifulSoup node to measure
+        model: The model name to use for tokenization
+        max_tokens: Token budget the counts will be compared against
     
-    return full_content
+    Returns:
+        Dictionary mapping id(tag) to its token count
+    """
+    # Pre-order listing; walking it backwards visits children before parents
+    tags = [root] + root.find_all(True)
 
+    # Gather each tag's own strings (its tags and text children) so the whole
+    # document is tokenized in one batched call
+    strings: List[str] = []
+    offsets = [0]
+    for tag in tags:
+        strings.extend(_tag_strings(tag))
+        strings.extend(child.output_ready() for child in tag.children if isinstance(child, NavigableString))
+        offsets.append(len(strings))
+    lengths = None
+    if max_tokens is not None:
+        sizes = [len(string.encode('utf-8')) for string in strings]
+        if sum(sizes) < max_tokens:
+            lengths = sizes
+    if lengths is None:
+        lengths = count_tokens_batch(strings, model)
 
-def traverse_dom(node, chunks: List[Dict[str, Any]], max_tokens: int, path: List[Dict[str, Any]] = None) -> None:
+    token_counts: Dict[int, int] = {}
+    for i in range(len(tags) - 1, -1, -1):
+        tag = tags[i]
+        total = sum(lengths[offsets[i]:offsets[i + 1]])
+        for child in tag.children:
+            if isinstance(child, Tag):
+                total += token_counts[id(child)]
+        token_counts[id(tag)] = total
+    return token_counts
+
+
+def iter_dom_chunks(
+    node: Tag,
+    max_tokens: int,
+    path: Tuple[Dict[str, Any], ...] = (),
+    token_counts: Optional[Dict[int, int]] = None
+) -> Iterator[Dict[str, Any]]:
     """
-    Recursively traverse DOM and create chunks that fit within token limits.
+    Traverse DOM depth-first and yield chunks that fit within token limits.
+    
+    The walk uses an explicit stack, so arbitrarily deep documents cannot hit
+    the recursion limit. The serialized ancestor tags are extended by one tag
+    per descent and shared by all chunks below it, so wrapping a chunk costs a
+    single concatenation regardless of its depth.
     
     Args:
         node: BeautifulSoup node to traverse
-        chunks: List to store the generated chunks
         max_tokens: Maximum tokens per chunk
-        path: Current path of parent elements
-    """
-    if path is None:
-        path = []
+        path: Current path of parent elements, shared between sibling chunks
+        token_counts: Precomputed counts from measure_dom (computed if omitted)
     
+    Yields:
+        Chunk dictionaries in document order
+    """
     if not node.name:
         return
 
-    node_length = count_tokens(str(node))
-    if node_length < max_tokens:
-        full_content = build_full_content(path, node)
-        chunks.append({
-            'tag': node.name, 
-            'attrs': node.attrs, 
-            'content': full_content, 
-            'path': path.copy()
-        })
-        return
+    if token_counts is None:
+        token_counts = measure_dom(node, max_tokens=max_tokens)
+
+    opening_tags = ''.join([p['opening_tag'] for p in path])
+    closing_tags = ''.join([p['closing_tag'] for p in path[::-1]])
+    stack = [(node, path, opening_tags, closing_tags)]
+
+    while stack:
+        node, path, opening_tags, closing_tags = stack.pop()
 
-    for child in node.children:
-        if child.name:
-            path.append({'tag': node.name, 'attrs': format_attrs(node.attrs)})
-            traverse_dom(child, chunks, max_tokens, path)
-            path.pop()
+        measured = token_counts[id(node)]
+        node_content = None
+        if max_tokens <= measured < max_tokens * _MEASURE_CONFIRM_RATIO:
+            node_content = str(node)
+            measured = count_tokens(node_content)
+        if measured < max_tokens:
+            if node_content is None:
+                node_content = str(node)
+            yield {
+                'tag': node.name, 
+                'attrs': node.attrs, 
+                'content': opening_tags + node_content + closing_tags, 
+                'path': path
+            }
+            continue
 
+        frame = path_frame(node)
+        child_path = path + (frame,)
+        child_opening_tags = opening_tags + frame['opening_tag']
+        child_closing_tags = frame['closing_tag'] + closing_tags
+        # Pushed in reverse so children are popped in document order
+        stack.extend([
+            (child, child_path, child_opening_tags, child_closing_tags)
+            for child in reversed(node.contents) if isinstance(child, Tag)
+        ])
 
-def get_common_root_path(soup1, soup2) -> Tuple[List, List]:
+
+def traverse_dom(
+    node: Tag,
+    chunks: List[Dict[str, Any]],
+    max_tokens: int,
+    path: Tuple[Dict[str, Any], ...] = (),
+    token_counts: Optional[Dict[int, int]] = None
+) -> None:
+    """
+    Traverse DOM and collect chunks that fit within token limits.
+    
+    Args:
+        node: BeautifulSoup node to traverse
+        chunks: List to store the generated chunks
+        max_tokens: Maximum tokens per chunk
+        path: Current path of parent elements, shared between sibling chunks
+        token_counts: Precomputed counts from measure_dom (computed if omitted)
+    """
+    chunks.extend(iter_dom_chunks(node, max_tokens, path, token_counts))
+
+
+def get_common_root_path(soup1: Optional[Tag], soup2: Optional[Tag]) -> Tuple[List[Tag], List[Tag]]:
     """
     Find the common root path between two BeautifulSoup objects.
     
@@ -114,19 +307,39 @@ def get_common_root_path(soup1, soup2) -> Tuple[List, List]:
     Returns:
         Tuple of common paths for both soups
     """
-    path1 = []
-    path2 = []
+    path1: List[Tag] = []
+    path2: List[Tag] = []
 
-    while (soup1 and soup2 and 
+    while (soup1 is not None and soup2 is not None and 
            soup1.name == soup2.name and 
            soup1.attrs == soup2.attrs):
         path1.append(soup1)
         path2.append(soup2)
         
         if len(soup1.contents) > 0 and len(soup2.contents) > 0:
-            soup1 = next((child for child in soup1.contents if child.name), None)
-            soup2 = next((child for child in soup2.contents if child.name), None)
+            soup1 = _first_child_tag(soup1)
+            soup2 = _first_child_tag(soup2)
         else:
             break
 
-    return path1, path2
\ No newline at end of file
+    return path1, path2
+
+
+def _first_child_tag(node: Tag) -> Optional[Tag]:
+    """
+    Return the first child of node that is a tag, skipping text and comments.
+    
+    A plain loop is cheaper here than either a generator expression or
+    node.find(True, recursive=False), which goes through BeautifulSoup's
+    generic matching machinery.
+    
+    Args:
+        node: BeautifulSoup tag
+    
+    Returns:
+        First child tag or None
+    """
+    for child in node.contents:
+        if isinstance(child, Tag):
+            return child
+    return None
\ No newline at end of file
@@ -7,9 +7,15 @@ token limits for LLM processing.
 """
 
 from html_chunking.html_chunking_main import get_html_chunks, HTMLChunker
-from html_chunking.html_chunking_core import count_tokens
-from html_chunking.html_cleaner import clean_html
-from html_chunking.html_splitter import split_html_by_dom, merge_html_chunks
+from html_chunking.html_chunking_core import count_tokens, count_tokens_batch
+from html_chunking.html_cleaner import clean_html, clean_html_soup
+from html_chunking.html_splitter import (
+    split_html_by_dom,
+    iter_html_chunks_by_dom,
+    merge_html_chunks,
+    iter_merged_html_chunks,
+    merge_html_chunks_optimal
+)
 
 __version__ = "1.0.0"
 __author__ = "HTML Chunking Team"
@@ -19,7 +25,12 @@ __all__ = [
     "get_html_chunks",
     "HTMLChunker",
     "count_tokens",
+    "count_tokens_batch",
     "clean_html",
+    "clean_html_soup",
     "split_html_by_dom",
-    "merge_html_chunks"
+    "iter_html_chunks_by_dom",
+    "merge_html_chunks",
+    "iter_merged_html_chunks",
+    "merge_html_chunks_optimal"
 ]
\ No newline at end of file
@@ -2,16 +2,20 @@
 Main HTML chunking interface and class-based API.
 """
 
-from typing import List, Optional, Tuple
-from html_chunking.html_cleaner import clean_html
-from html_chunking.html_splitter import split_html_by_dom, merge_html_chunks
+from bs4 import BeautifulSoup
+from typing import Iterator, List, Optional, Tuple, Union
+from html_chunking.html_cleaner import clean_html_soup
+from html_chunking.html_splitter import (
+    iter_html_chunks_by_dom, iter_merged_html_chunks, merge_html_chunks_optimal
+)
 
 
 def get_html_chunks(
     html: str, 
     max_tokens: int, 
     is_clean_html: bool = True, 
-    attr_cutoff_len: int = 40
+    attr_cutoff_len: int = 40,
+    optimal_merge: bool = False
 ) -> List[str]:
     """
     Main function to split HTML into chunks with token limits.
@@ -21,22 +25,18 @@ def get_html_chunks(
         max_tokens: Maximum tokens per chunk
         is_clean_html: Whether to clean the HTML first
         attr_cutoff_len: Maximum length for HTML attributes (0 for no limit)
+        optimal_merge: Use merge_html_chunks_optimal instead of the greedy merge
     
     Returns:
         List of HTML chunk strings
     """
-    # Clean HTML if requested
-    if is_clean_html:
-        html, _ = clean_html(html, attr_cutoff_len)
-    
-    # Split into initial chunks
-    chunks = split_html_by_dom(html, max_tokens)
-    chunk_contents = [chunk['content'] for chunk in chunks]
-    
-    # Merge chunks optimally
-    merged_chunks = merge_html_chunks(chunk_contents, max_tokens)
-    
-    return merged_chunks
+    chunker = HTMLChunker(
+        max_tokens=max_tokens,
+        clean_html=is_clean_html,
+        attr_cutoff_len=attr_cutoff_len,
+        optimal_merge=optimal_merge
+    )
+    return chunker.chunk(html)
 
 
 class HTMLChunker:
@@ -49,7 +49,9 @@ class HTMLChunker:
         max_tokens: int = 1000,
         clean_html: bool = True,
         attr_cutoff_len: int = 40,
-        model: str = "gpt-3.5-turbo"
+        model: str = "gpt-3.5-turbo",
+        optimal_merge: bool = False,
+        remove_css_hidden: bool = True
     ):
         """
         Initialize HTMLChunker with configuration.
@@ -59,12 +61,17 @@ class HTMLChunker:
             clean_html: Whether to clean HTML before chunking
             attr_cutoff_len: Maximum attribute length
             model: Tokenizer model to use
+            optimal_merge: Minimize the number of chunks instead of merging greedily
+            remove_css_hidden: Whether cleaning removes elements hidden by
+                stylesheet rules (disable for faster cleaning)
         """
         self.max_tokens = max_tokens
         self.clean_html = clean_html
         self.attr_cutoff_len = attr_cutoff_len
         self.model = model
-        self._last_removed_content = None
+        self.optimal_merge = optimal_merge
+        self.remove_css_hidden = remove_css_hidden
+        self._last_removed_content: Optional[str] = None
     
     def chunk(self, html: str) -> List[str]:
         """
@@ -76,12 +83,57 @@ class HTMLChunker:
         Returns:
             List of HTML chunk strings
         """
-        return get_html_chunks(
-            html=html,
-            max_tokens=self.max_tokens,
-            is_clean_html=self.clean_html,
-            attr_cutoff_len=self.attr_cutoff_len
-        )
+        return list(self.iter_chunks(html))
+    
+    def iter_chunks(self, html: str) -> Iterator[str]:
+        """
+        Lazily split HTML into chunks using instance configuration.
+        
+        With the greedy merge only one merged chunk is held at a time, so
+        chunks can be written out as they are produced. Content removed while
+        cleaning is available from get_last_removed_content().
+        
+        Args:
+            html: HTML string to chunk
+        
+        Yields:
+            HTML chunk strings
+        """
+        document, removed_content = self._clean(html)
+        if removed_content is not None:
+            self._last_removed_content = removed_content
+        yield from self._iter_merged(document)
+    
+    def _clean(self, html: str) -> Tuple[Union[str, BeautifulSoup], Optional[str]]:
+        """
+        Clean HTML if configured to, without touching instance state.
+        
+        Args:
+            html: HTML string to clean
+        
+        Returns:
+            Tuple of (document, removed_content); removed_content is None
+            when cleaning is disabled
+        """
+        if not self.clean_html:
+            return html, None
+        return clean_html_soup(html, self.attr_cutoff_len, self.remove_css_hidden)
+    
+    def _iter_merged(self, document: Union[str, BeautifulSoup]) -> Iterator[str]:
+        """
+        Split and merge a (cleaned) document using instance configuration.
+        
+        Args:
+            document: HTML string or parsed document
+        
+        Yields:
+            HTML chunk strings
+        """
+        chunk_contents = (chunk['content'] for chunk in iter_html_chunks_by_dom(document, self.max_tokens))
+        if self.optimal_merge:
+            yield from merge_html_chunks_optimal(list(chunk_contents), self.max_tokens)
+        else:
+            yield from iter_merged_html_chunks(chunk_contents, self.max_tokens)
     
     def chunk_with_metadata(self, html: str) -> Tuple[List[str], Optional[str]]:
         """
@@ -93,18 +145,12 @@ class HTMLChunker:
         Returns:
             Tuple of (chunks, removed_content)
         """
-        from html_chunking.html_cleaner import clean_html as clean_html_func
-        
-        if self.clean_html:
-            cleaned_html, removed_content = clean_html_func(html, self.attr_cutoff_len)
+        # The removed content is kept local so concurrent calls on a shared
+        # instance cannot report each other's content
+        document, removed_content = self._clean(html)
+        if removed_content is not None:
             self._last_removed_content = removed_content
-        else:
-            cleaned_html = html
-            removed_content = None
-        
-        chunks = split_html_by_dom(cleaned_html, self.max_tokens)
-        chunk_contents = [chunk['content'] for chunk in chunks]
-        merged_chunks = merge_html_chunks(chunk_contents, self.max_tokens)
+        merged_chunks = list(self._iter_merged(document))
         
         return merged_chunks, removed_content
     
@@ -2,79 +2,296 @@
 HTML cleaning utilities for removing unwanted content and optimizing for chunking.
 """
 
+import re
+from functools import lru_cache
+import soupsieve
 from bs4 import BeautifulSoup
-from typing import Tuple, List
+from typing import Iterator, Tuple, List
 
+try:
+    import tinycss2  # type: ignore[import-untyped, import-not-found, unused-ignore]
+except ImportError:
+    tinycss2 = None
 
-def clean_html(html: str, attr_max_len: int = 0) -> Tuple[str, str]:
+
+# A style rule whose declaration block hides the elements it selects
+_HIDDEN_RULE_RE = re.compile(
+    r'([^{}]+)\{([^{}]*?(?:display\s*:\s*none|visibility\s*:\s*hidden)[^{}]*)\}',
+    re.IGNORECASE
+)
+_CSS_COMMENT_RE = re.compile(r'/\*.*?\*/', re.DOTALL)
+# Characters that delimit rules and at-rules in a stylesheet
+_CSS_STRUCTURE_RE = re.compile(r'[@{};]')
+# Characters that nest or quote parts of a selector list, and escapes
+_SELECTOR_STRUCTURE_RE = re.compile(r'\\.|["\'()\[\],]', re.DOTALL)
+# An inline style attribute that hides its element
+_HIDDEN_STYLE_RE = re.compile(r'display\s*:\s*none|visibility\s*:\s*hidden', re.IGNORECASE)
+
+_REMOVED_TAGS = frozenset(('script', 'style'))
+_TRUNCATED_ATTRS = frozenset(('href', 'src', 'd', 'url', 'data-url', 'data-src', 'data-src-hq'))
+
+# Only stylesheets up to this many characters are kept in the selector cache,
+# so large inlined stylesheets are not held alive between documents
+_CACHED_CSS_MAX_LEN = 32768
+
+
+def _hidden_rule_selectors(css_text: str) -> Tuple[Tuple[str, ...], ...]:
+    """
+    Return the selectors of style rules that hide elements.
+    
+    Results for stylesheets up to _CACHED_CSS_MAX_LEN characters are cached
+    per stylesheet text, since pages from the same site tend to repeat
+    identical <style> blocks.
+    
+    Args:
+        css_text: Contents of a <style> element
+    
+    Returns:
+        Selectors of each hiding rule
+    """
+    if len(css_text) <= _CACHED_CSS_MAX_LEN:
+        return _hidden_rule_selectors_cached(css_text)
+    return tuple(_iter_hidden_rule_selectors(css_text))
+
+
+@lru_cache(maxsize=256)
+def _hidden_rule_selectors_cached(css_text: str) -> Tuple[Tuple[str, ...], ...]:
+    """
+    Return the selectors of hiding rules, remembering recent stylesheets.
+    
+    Args:
+        css_text: Contents of a <style> element
+    
+    Returns:
+        Selectors of each hiding rule
+    """
+    return tuple(_iter_hidden_rule_selectors(css_text))
+
+
+def _strip_at_rules(css_text: str) -> str:
+    """
+    Remove at-rules from a stylesheet, including every rule nested in them.
+    
+    Rules inside @media, @supports and similar blocks only apply under some
+    condition, so like top-level @import statements they are left out and
+    only unconditional style rules remain.
+    
+    Args:
+        css_text: Stylesheet without comments
+    
+    Returns:
+        The top-level style rules of the stylesheet
+    """
+    kept = []
+    start = 0
+    depth = 0
+    in_at_rule = False
+    for match in _CSS_STRUCTURE_RE.finditer(css_text):
+        char = match.group()
+        if char == '{':
+            depth += 1
+        elif char == '}':
+            depth = max(depth - 1, 0)
+            if in_at_rule and depth == 0:
+                in_at_rule = False
+                start = match.end()
+        elif char == ';':
+            if in_at_rule and depth == 0:
+                in_at_rule = False
+                start = match.end()
+        elif not in_at_rule and depth == 0:
+            kept.append(css_text[start:match.start()])
+            in_at_rule = True
+    if not in_at_rule:
+        kept.append(css_text[start:])
+    return ''.join(kept)
+
+
+def _split_selector_list(selectors: str) -> Tuple[str, ...]:
+    """
+    Split a selector list at its top-level commas.
+    
+    Commas inside parentheses, attribute brackets or quoted strings, as in
+    :is(.ad, .promo) or [title="a,b"], belong to a single selector.
+    
+    Args:
+        selectors: Comma-separated selector list
+    
+    Returns:
+        Each selector of the list, stripped of surrounding whitespace
+    """
+    parts = []
+    start = 0
+    depth = 0
+    quote = None
+    for match in _SELECTOR_STRUCTURE_RE.finditer(selectors):
+        char = match.group()
+        if len(char) > 1:
+            # Escaped character
+            continue
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in '"\'':
+            quote = char
+        elif char in '([':
+            depth += 1
+        elif char in ')]':
+            depth = max(depth - 1, 0)
+        elif depth == 0:
+            parts.append(selectors[start:match.start()].strip())
+            start = match.end()
+    parts.append(selectors[start:].strip())
+    return tuple(parts)
+
+
+def _iter_hidden_rule_selectors(css_text: str) -> Iterator[Tuple[str, ...]]:
+    """
+    Yield the selectors of style rules that hide elements.
+    
+    Uses tinycss2 when it is installed and falls back to a regular expression
+    over the stylesheet otherwise.
+    
+    Args:
+        css_text: Contents of a <style> element
+    
+    Yields:
+        Selectors of each hiding rule, split at top-level commas
+    """
+    if tinycss2 is None:
+        for match in _HIDDEN_RULE_RE.finditer(_strip_at_rules(_CSS_COMMENT_RE.sub('', css_text))):
+            yield _split_selector_list(match.group(1))
+        return
+
+    for rule in tinycss2.parse_stylesheet(css_text, skip_comments=True, skip_whitespace=True):
+        # Rules nested in @media, @supports and similar blocks are conditional
+        # and are skipped along with their at-rule
+        if rule.type != 'qualified-rule':
+            continue
+        declarations = tinycss2.parse_declaration_list(rule.content, skip_comments=True, skip_whitespace=True)
+        for declaration in declarations:
+            if declaration.type != 'declaration':
+                continue
+            hidden_value = {'display': 'none', 'visibility': 'hidden'}.get(declaration.lower_name)
+            if hidden_value and any(
+                token.type == 'ident' and token.lower_value == hidden_value
+                for token in declaration.value
+            ):
+                # Commas nested in functions and brackets are inside block
+                # tokens, so only top-level ones are literals here
+                parts: List[List[object]] = [[]]
+                for token in rule.prelude:
+                    if token.type == 'literal' and token.value == ',':
+                        parts.append([])
+                    else:
+                        parts[-1].append(token)
+                yield tuple(tinycss2.serialize(part).strip() for part in parts)
+                break
+
+
+def clean_html(html: str, attr_max_len: int = 0, remove_css_hidden: bool = True) -> Tuple[str, str]:
     """
     Clean HTML by removing scripts, styles, hidden elements, and long attributes.
     
     Args:
         html: Raw HTML string to clean
         attr_max_len: Maximum length for attributes (0 = no limit)
+        remove_css_hidden: Whether to remove elements hidden by <style> rules;
+            disabling it skips stylesheet parsing and selector matching
     
     Returns:
         Tuple of (cleaned_html, removed_content_text)
     """
+    soup, removed_content_text = clean_html_soup(html, attr_max_len, remove_css_hidden)
+    return str(soup), removed_content_text
+
+
+def clean_html_soup(html: str, attr_max_len: int = 0, remove_css_hidden: bool = True) -> Tuple[BeautifulSoup, str]:
+    """
+    Clean HTML like clean_html but return the parsed tree instead of a string.
+    
+    Passing the tree straight to split_html_by_dom avoids serializing the
+    cleaned document only to parse it again.
+    
+    Args:
+        html: Raw HTML string to clean
+        attr_max_len: Maximum length for attributes (0 = no limit)
+        remove_css_hidden: Whether to remove elements hidden by <style> rules;
+            disabling it skips stylesheet parsing and selector matching
+    
+    Returns:
+        Tuple of (cleaned_soup, removed_content_text)
+    """
     soup = BeautifulSoup(html, "lxml")
     removed_content = []
 
-    # Remove CSS-hidden elements
-    css_texts = [style.get_text() for style in soup.find_all('style')]
-    for css_text in css_texts:
-        try:
-            sheet = cssutils.parseString(css_text)
-            for rule in sheet:
-                if rule.type == rule.STYLE_RULE:
-                    selector = rule.selectorText
+    # Every element, in document order, shared by the passes below
+    elements = soup.find_all(True)
+
+    # Remove CSS-hidden elements, matching all hiding selectors in one walk
+    if remove_css_hidden:
+        css_texts = [element.get_text() for element in elements if element.name == 'style']
+        hidden_selectors = []
+        for css_text in css_texts:
+            for selectors in _hidden_rule_selectors(css_text):
+                # Most selector lists compile as a whole; only lists with a
+                # part soupsieve rejects are checked selector by selector
+                selector_list = ', '.join(selectors)
+                try:
+                    soupsieve.compile(selector_list)
+                except Exception:
+                    pass
+                else:
+                    hidden_selectors.append(selector_list)
+                    continue
+                for selector in selectors:
                     # Skip pseudo-elements
-                    if '::' in selector or ':after' in selector or ':before' in selector:
+                    if not selector or '::' in selector or ':after' in selector or ':before' in selector:
+                        continue
+                    try:
+                        soupsieve.compile(selector)
+                    except Exception:
+                        # Skip selectors soupsieve cannot handle
                         continue
-                    
-                    # Remove elements with display:none or visibility:hidden
-                    if 'display' in rule.style and 'none' in rule.style['display']:
-                        for element in soup.select(selector):
-                            removed_content.append(element.get_text())
-                            element.decompose()
-                    elif 'visibility' in rule.style and 'hidden' in rule.style['visibility']:
-                        for element in soup.select(selector):
-                            removed_content.append(element.get_text())
-                            element.decompose()
-        except Exception:
-            # Skip malformed CSS
+                    hidden_selectors.append(selector)
+
+        if hidden_selectors:
+            for hidden in soupsieve.compile(', '.join(hidden_selectors)).select(soup):
+                # Nested inside an element removed earlier in this loop
+                if hidden.decomposed:
+                    continue
+                removed_content.append(hidden.get_text())
+                hidden.decompose()
+
+    # Remove scripts, styles, inline-hidden, aria-hidden and non-focusable
+    # elements and truncate long attributes in a single pass
+    for element in elements:
+        # Elements removed above or inside a subtree removed earlier in the walk
+        if element.decomposed:
             continue
 
-    # Remove script and style tags
-    for tag in ['script', 'style']:
-        for element in soup.find_all(tag):
+        if element.name in _REMOVED_TAGS:
             removed_content.append(element.get_text())
             element.decompose()
+            continue
+
+        attrs = element.attrs
+        if attrs.get('aria-hidden') == 'true' or attrs.get('tabindex') == '-1':
+            removed_content.append(element.get_text())
+            element.decompose()
+            continue
+
+        style = attrs.get('style')
+        if isinstance(style, str) and _HIDDEN_STYLE_RE.search(style):
+            element.decompose()
+            continue
+
+        if attr_max_len:
+            # Replacing values of existing keys is safe while iterating
+            for attr, value in attrs.items():
+                if attr in _TRUNCATED_ATTRS and isinstance(value, str) and len(value) > attr_max_len:
+                    attrs[attr] = value[:attr_max_len] + "..."
 
-    # Remove elements with inline hidden styles
-    for elem in soup.find_all(style=lambda value: value and (
-        'display:none' in value or 'display: none' in value or 
-        'visibility:hidden' in value or 'visibility: hidden' in value
-    )):
-        elem.decompose()
-
-    # Truncate long attributes
-    attr_to_truncate = ['href', 'src', 'd', 'url', 'data-url', 'data-src', 'data-src-hq']
-    for attr in attr_to_truncate:
-        for tag in soup.find_all(attrs={attr: True}):
-            if attr_max_len and len(tag[attr]) > attr_max_len:
-                tag[attr] = tag[attr][:attr_max_len] + "..."
-
-    # Remove aria-hidden and non-focusable elements
-    for element in soup.find_all(attrs={"aria-hidden": "true"}):
-        removed_content.append(element.get_text())
-        element.decompose()
-
-    for element in soup.find_all(attrs={"tabindex": "-1"}):
-        removed_content.append(element.get_text())
-        element.decompose()
-
-    cleaned_html = str(soup)
     removed_content_text = "\n".join(removed_content)
     
-    return cleaned_html, removed_content_text
\ No newline at end of file
+    return soup, removed_content_text
\ No newline at end of file
@@ -2,26 +2,53 @@
 HTML splitting and merging utilities for creating optimal chunks.
 """
 
-from bs4 import BeautifulSoup
-from typing import List, Dict, Any
-from html_chunking.html_chunking_core import traverse_dom, count_tokens, get_common_root_path
+from bs4 import BeautifulSoup, NavigableString, PageElement, Tag
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Set, Tuple, Union
+from html_chunking.html_chunking_core import iter_dom_chunks, count_tokens, count_tokens_batch, get_common_root_path
 
 
-def split_html_by_dom(html_string: str, max_tokens: int) -> List[Dict[str, Any]]:
+# merge_html_chunks_optimal falls back to the greedy merge above this many
+# chunks, or once its candidate merges would parse more than this many
+# characters in total (about 1.5 s of merging on a typical machine)
+OPTIMAL_MERGE_LIMIT = 200
+OPTIMAL_MERGE_BUDGET = 2_000_000
+
+# Splicing markup into a chunk can change how the tokenizer merges characters
+# on either side of the junctions, so each merge that has not been recounted
+# exactly may be off by up to this many tokens
+MERGE_TOKEN_MARGIN = 3
+
+
+def iter_html_chunks_by_dom(html_string: Union[str, BeautifulSoup], max_tokens: int) -> Iterator[Dict[str, Any]]:
+    """
+    Lazily split HTML into chunks by DOM structure, respecting token limits.
+    
+    Args:
+        html_string: HTML string to split, or an already parsed document
+        max_tokens: Maximum tokens per chunk
+    
+    Yields:
+        Chunk dictionaries with metadata, in document order
+    """
+    if isinstance(html_string, BeautifulSoup):
+        soup = html_string
+    else:
+        soup = BeautifulSoup(html_string, 'lxml')
+    yield from iter_dom_chunks(soup, max_tokens)
+
+
+def split_html_by_dom(html_string: Union[str, BeautifulSoup], max_tokens: int) -> List[Dict[str, Any]]:
     """
     Split HTML into chunks by DOM structure, respecting token limits.
     
     Args:
-        html_string: HTML string to split
+        html_string: HTML string to split, or an already parsed document
         max_tokens: Maximum tokens per chunk
     
     Returns:
         List of chunk dictionaries with metadata
     """
-    chunks = []
-    soup = BeautifulSoup(html_string, 'html.parser')
-    traverse_dom(soup, chunks, max_tokens)
-    return chunks
+    return list(iter_html_chunks_by_dom(html_string, max_tokens))
 
 
 def merge_html_chunk(html_1: str, html_2: str) -> str:
@@ -37,17 +64,203 @@ def merge_html_chunk(html_1: str, html_2: str) -> str:
     """
     soup1 = BeautifulSoup(html_1, 'html.parser')
     soup2 = BeautifulSoup(html_2, 'html.parser')
+    _merge_into(soup1, soup2)
+    return str(soup1)
+
+
+def _element_signature(element: PageElement) -> Tuple[Optional[str], str]:
+    """
+    Build a hashable key that is equal for elements BeautifulSoup considers equal.
+    
+    Args:
+        element: Tag or text node
+    
+    Returns:
+        Tuple of (tag name or None for text, serialized element)
+    """
+    return (element.name if isinstance(element, Tag) else None), str(element)
+
 
+def _merge_into(
+    soup1: BeautifulSoup,
+    soup2: BeautifulSoup,
+    seen_cache: Optional[Dict[int, Set[Tuple[Optional[str], str]]]] = None
+) -> Tuple[List[PageElement], str]:
+    """
+    Move the unique content of soup2 under the common parent in soup1.
+    
+    Args:
+        soup1: Parsed chunk to merge into, modified in place
+        soup2: Parsed chunk to merge from; appended elements are moved out of it
+        seen_cache: Child signatures by id() of parents in soup1, kept across
+            merges into the same soup1 so its children are not serialized
+            again; must be cleared when elements are removed from soup1
+    
+    Returns:
+        Tuple of (appended_elements, appended_html); the elements let the
+        merge be undone with extract()
+    """
     path1, path2 = get_common_root_path(soup1, soup2)
     common_parent1 = path1[-1] if path1 else soup1
     common_parent2 = path2[-1] if path2 else soup2
 
     # Append unique content from second chunk
-    for element in common_parent2.contents:
-        if element not in common_parent1.contents:
+    if seen_cache is None:
+        seen = {_element_signature(child) for child in common_parent1.contents}
+    else:
+        # Appending below a parent changes the serialization of one of each
+        # ancestor's children, so their cached signatures go stale
+        for ancestor in path1[:-1]:
+            seen_cache.pop(id(ancestor), None)
+        cached = seen_cache.get(id(common_parent1))
+        if cached is None:
+            cached = {_element_signature(child) for child in common_parent1.contents}
+            seen_cache[id(common_parent1)] = cached
+        seen = cached
+    appended: List[PageElement] = []
+    appended_html: List[str] = []
+    # Iterate over a snapshot: appending moves each element out of
+    # common_parent2, which would otherwise skip the element after it
+    for element in list(common_parent2.contents):
+        signature = _element_signature(element)
+        if signature not in seen:
             common_parent1.append(element)
+            appended.append(element)
+            # str() of a text node is unescaped (and drops comment markers),
+            # so count what the emitted chunk will actually contain
+            if isinstance(element, NavigableString):
+                appended_html.append(element.output_ready())
+            else:
+                appended_html.append(signature[1])
+            seen.add(signature)
+
+    return appended, ''.join(appended_html)
+
+
+def iter_merged_html_chunks(html_chunks: Iterable[str], max_tokens: int) -> Iterator[str]:
+    """
+    Greedily merge a stream of HTML chunks, yielding each one once it is full.
+    
+    Only the chunk being filled is held in memory, as a parsed tree that each
+    following chunk is merged into, so it is never re-parsed and is serialized
+    only when it is emitted. Merges are accepted on an estimated token count
+    and every merged chunk is counted exactly before it is emitted; merges
+    that turn out to exceed max_tokens are undone and their chunks merged
+    into the next chunk instead.
+    
+    Args:
+        html_chunks: Iterable of HTML chunk strings
+        max_tokens: Maximum tokens per merged chunk
+    
+    Yields:
+        Merged HTML chunks in document order
+    """
+    chunks = iter(html_chunks)
+    # Chunks to process before the rest of the input, last one first
+    pending: List[Tuple[str, Optional[BeautifulSoup]]] = []
+    current_soup: Optional[BeautifulSoup] = None
+    # Source string of the first chunk in current_soup
+    current_chunk = ''
+    current_tokens = 0
+    # Whether a merge into current_soup was accepted on an exact count
+    merged_exactly = False
+    # Appended elements and source chunk of each merge accepted on an estimate
+    unverified: List[Tuple[List[PageElement], str]] = []
+    # Signatures of children already in current_soup, see _merge_into
+    seen_cache: Dict[int, Set[Tuple[Optional[str], str]]] = {}
+
+    while True:
+        next_chunk: Optional[str]
+        next_soup: Optional[BeautifulSoup]
+        if pending:
+            next_chunk, next_soup = pending.pop()
+        else:
+            next_chunk = next(chunks, None)
+            next_soup = None
+        if next_chunk is None:
+            if current_soup is None:
+                break
+            yield _verified_chunk(current_soup, current_chunk, merged_exactly, unverified, pending, max_tokens)
+            current_soup = None
+            continue
+        if next_soup is None:
+            next_soup = BeautifulSoup(next_chunk, 'html.parser')
+        if current_soup is None:
+            current_soup, current_chunk = next_soup, next_chunk
+            current_tokens = count_tokens(next_chunk)
+            merged_exactly = False
+            seen_cache.clear()
+            continue
+
+        # A full (or oversized) chunk cannot take anything more, so skip the
+        # merge attempt and its exact recount of the whole chunk
+        if current_tokens >= max_tokens:
+            pending.append((next_chunk, next_soup))
+            yield _verified_chunk(current_soup, current_chunk, merged_exactly, unverified, pending, max_tokens)
+            current_soup = None
+            continue
+
+        appended, appended_html = _merge_into(current_soup, next_soup, seen_cache)
+
+        # Only the appended markup is tokenized. The sum can be off around
+        # the junctions it was spliced into, so recount exactly whenever the
+        # estimate comes within the accumulated margin of the limit
+        merged_tokens = current_tokens + count_tokens(appended_html)
+        exact = merged_tokens + (len(unverified) + 1) * MERGE_TOKEN_MARGIN > max_tokens
+        if exact:
+            merged_tokens = count_tokens(str(current_soup))
+
+        if merged_tokens <= max_tokens:
+            current_tokens = merged_tokens
+            if exact:
+                merged_exactly = True
+                unverified.clear()
+            else:
+                unverified.append((appended, next_chunk))
+        else:
+            for element in appended:
+                element.extract()
+            # next_soup lost the elements moved out of it, so parse again
+            pending.append((next_chunk, None))
+            yield _verified_chunk(current_soup, current_chunk, merged_exactly, unverified, pending, max_tokens)
+            current_soup = None
 
-    return str(soup1)
+
+def _verified_chunk(
+    soup: BeautifulSoup,
+    source: str,
+    merged_exactly: bool,
+    unverified: List[Tuple[List[PageElement], str]],
+    pending: List[Tuple[str, Optional[BeautifulSoup]]],
+    max_tokens: int
+) -> str:
+    """
+    Serialize a merged chunk, undoing estimated merges until it fits exactly.
+    
+    Args:
+        soup: Merged chunk, modified in place when merges are undone
+        source: Source string of the first chunk merged into soup
+        merged_exactly: Whether a merge into soup was accepted on an exact count
+        unverified: Merges accepted on an estimate, emptied by this call
+        pending: Chunk queue that the chunks of undone merges are pushed onto
+        max_tokens: Maximum tokens per merged chunk
+    
+    Returns:
+        Serialized chunk; the unchanged source when nothing remains merged
+    """
+    if not unverified and not merged_exactly:
+        return source
+    html = str(soup)
+    while unverified and count_tokens(html) > max_tokens:
+        elements, chunk = unverified.pop()
+        for element in elements:
+            element.extract()
+        pending.append((chunk, None))
+        if not unverified and not merged_exactly:
+            return source
+        html = str(soup)
+    unverified.clear()
+    return html
 
 
 def merge_html_chunks(html_chunks: List[str], max_tokens: int) -> List[str]:
@@ -61,21 +274,81 @@ def merge_html_chunks(html_chunks: List[str], max_tokens: int) -> List[str]:
     Returns:
         List of optimally merged HTML chunks
     """
+    return list(iter_merged_html_chunks(html_chunks, max_tokens))
+
+
+def merge_html_chunks_optimal(html_chunks: List[str], max_tokens: int) -> List[str]:
+    """
+    Merge HTML chunks into as few chunks as possible with the most even sizes.
+    
+    Every run of consecutive chunks that still fits under the token limit once
+    merged is measured, then a dynamic program picks the partition with the
+    fewest chunks, breaking ties by the smallest sum of squared unused tokens.
+    Each candidate run costs a full merge that grows with the run, so inputs
+    with more than OPTIMAL_MERGE_LIMIT chunks, or whose candidates would parse
+    more than OPTIMAL_MERGE_BUDGET characters, fall back to merge_html_chunks.
+    
+    Args:
+        html_chunks: List of HTML chunk strings
+        max_tokens: Maximum tokens per merged chunk
+    
+    Returns:
+        List of merged HTML chunks
+    """
+    if len(html_chunks) > OPTIMAL_MERGE_LIMIT:
+        return merge_html_chunks(html_chunks, max_tokens)
     if not html_chunks:
         return []
     
+    n = len(html_chunks)
+    
+    # runs[start] maps the end of each fitting run to its unused tokens. All
+    # runs grow one chunk per round so each round is a single batched count.
+    runs = [
+        {start + 1: max(max_tokens - tokens, 0)}
+        for start, tokens in enumerate(count_tokens_batch(html_chunks))
+    ]
+    merged = list(html_chunks)
+    active = list(range(n - 1))
+    length = 1
+    budget = OPTIMAL_MERGE_BUDGET
+    while active:
+        budget -= sum([len(merged[start]) + len(html_chunks[start + length]) for start in active])
+        if budget < 0:
+            return merge_html_chunks(html_chunks, max_tokens)
+        candidates = [merge_html_chunk(merged[start], html_chunks[start + length]) for start in active]
+        still_fitting: List[int] = []
+        for start, candidate, tokens in zip(active, candidates, count_tokens_batch(candidates)):
+            if tokens > max_tokens:
+                continue
+            merged[start] = candidate
+            runs[start][start + length + 1] = max_tokens - tokens
+            if start + length + 1 < n:
+                still_fitting.append(start)
+        active = still_fitting
+        length += 1
+    
+    # best[i] is (chunk count, squared unused tokens, run start) for the first i chunks
+    # best[i] starts at n + 1 chunks, more than any real partition needs
+    best = [(0, 0, 0)] + [(n + 1, 0, 0)] * n
+    for start in range(n):
+        count, cost, _ = best[start]
+        for end, unused in runs[start].items():
+            option = (count + 1, cost + unused * unused, start)
+            if option[:2] < best[end][:2]:
+                best[end] = option
+    
+    bounds = []
+    end = n
+    while end:
+        start = best[end][2]
+        bounds.append((start, end))
+        end = start
+    
     merged_chunks = []
-    current_chunk = html_chunks[0]
-
-    for i in range(1, len(html_chunks)):
-        next_chunk = html_chunks[i]
-        merged = merge_html_chunk(current_chunk, next_chunk)
-
-        if count_tokens(merged) <= max_tokens:
-            current_chunk = merged
-        else:
-            merged_chunks.append(current_chunk)
-            current_chunk = next_chunk
-
-    merged_chunks.append(current_chunk)
-    return merged_chunks
\ No newline at end of file
+    for start, end in reversed(bounds):
+        chunk = html_chunks[start]
+        for next_chunk in html_chunks[start + 1:end]:
+            chunk = merge_html_chunk(chunk, next_chunk)
+        merged_chunks.append(chunk)
+    return merged_chunks
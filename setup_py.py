@@ -2,8 +2,21 @@
 Setup script for HTML Chunking Library
 """
 
+import os
+
 from setuptools import setup, find_packages
 
+# Set HTML_CHUNKING_USE_MYPYC=1 to compile the DOM traversal and merge modules
+# with mypyc (requires mypy); the pure Python package is built otherwise
+ext_modules = []
+if os.environ.get("HTML_CHUNKING_USE_MYPYC") == "1":
+    from mypyc.build import mypycify
+
+    ext_modules = mypycify([
+        "html_chunking/html_chunking_core.py",
+        "html_chunking/html_splitter.py",
+    ])
+
 with open("README.md", "r", encoding="utf-8") as fh:
     long_description = fh.read()
 
@@ -25,6 +38,7 @@ setup(
         "Documentation": "https://github.com/yourusername/html-chunking/wiki",
     },
     packages=find_packages(),
+    ext_modules=ext_modules,
     classifiers=[
         "Development Status :: 4 - Beta",
         "Intended Audience :: Developers",
@@ -53,6 +67,9 @@ setup(
         "web": [
             "gradio>=4.0",
         ],
+        "css": [
+            "tinycss2>=1.2",
+        ],
     },
     entry_points={
         "console_scripts": [
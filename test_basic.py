@@ -2,8 +2,15 @@
 Basic tests for HTML Chunking Library
 """
 
+import random
+
 import pytest
-from html_chunking import get_html_chunks, HTMLChunker, count_tokens
+from bs4 import BeautifulSoup
+from html_chunking import (
+    get_html_chunks, HTMLChunker, count_tokens, count_tokens_batch, clean_html, merge_html_chunks,
+    split_html_by_dom
+)
+from html_chunking import html_cleaner
 
 
 def test_count_tokens():
@@ -14,6 +21,12 @@ def test_count_tokens():
     assert isinstance(tokens, int)
 
 
+def test_count_tokens_batch():
+    """Test batched token counting matches single counts."""
+    texts = ["First sentence.", "<p>Second</p>", ""]
+    assert count_tokens_batch(texts) == [count_tokens(text) for text in texts]
+
+
 def test_basic_chunking():
     """Test basic HTML chunking."""
     html = """
@@ -69,6 +82,198 @@ def test_chunker_with_metadata():
     assert all(count_tokens(chunk) <= 60 for chunk in chunks)
 
 
+def test_clean_html_css_hidden():
+    """Test removal of elements hidden by stylesheet rules."""
+    html = """
+    <html>
+    <head>
+        <style>
+            .ads { display: none; }
+            .sidebar, .promo::after { visibility: hidden; }
+            .visible { color: red; }
+        </style>
+    </head>
+    <body>
+        <div class="ads">Advertisement</div>
+        <div class="sidebar">Sidebar</div>
+        <div class="visible">Article</div>
+    </body>
+    </html>
+    """
+    cleaned, removed = clean_html(html)
+
+    assert "Advertisement" not in cleaned
+    assert "Sidebar" not in cleaned
+    assert "Article" in cleaned
+    assert "Advertisement" in removed
+
+
+def test_clean_html_keeps_conditionally_hidden(monkeypatch):
+    """Test rules inside @media blocks do not remove content."""
+    html = """
+    <html>
+    <head>
+        <style>
+            .ads { display: none; }
+            @media print { .nav { display: none; } }
+            @media (max-width: 600px) { .sidebar { visibility: hidden; } }
+        </style>
+    </head>
+    <body>
+        <div class="ads">Advertisement</div>
+        <div class="nav">Navigation</div>
+        <div class="sidebar">Sidebar</div>
+    </body>
+    </html>
+    """
+    # Check both the tinycss2 parser and the regex fallback
+    for css_parser in (html_cleaner.tinycss2, None):
+        monkeypatch.setattr(html_cleaner, "tinycss2", css_parser)
+        html_cleaner._hidden_rule_selectors_cached.cache_clear()
+        cleaned, _ = clean_html(html)
+
+        assert "Advertisement" not in cleaned
+        assert "Navigation" in cleaned
+        assert "Sidebar" in cleaned
+    html_cleaner._hidden_rule_selectors_cached.cache_clear()
+
+
+def test_clean_html_selectors_with_commas(monkeypatch):
+    """Test hiding selectors with nested commas are not split apart."""
+    html = """
+    <html>
+    <head>
+        <style>
+            :is(.ad, .promo) { display: none; }
+            [title="a,b"], p::before { visibility: hidden; }
+        </style>
+    </head>
+    <body>
+        <div class="ad">Advertisement</div>
+        <div class="promo">Promotion</div>
+        <div title="a,b">Tooltip</div>
+        <p>Paragraph</p>
+    </body>
+    </html>
+    """
+    for css_parser in (html_cleaner.tinycss2, None):
+        monkeypatch.setattr(html_cleaner, "tinycss2", css_parser)
+        html_cleaner._hidden_rule_selectors_cached.cache_clear()
+        cleaned, _ = clean_html(html)
+
+        assert "Advertisement" not in cleaned
+        assert "Promotion" not in cleaned
+        assert "Tooltip" not in cleaned
+        assert "Paragraph" in cleaned
+    html_cleaner._hidden_rule_selectors_cached.cache_clear()
+
+
+def test_chunk_wrappers_match_beautifulsoup():
+    """Test parent tags wrapped around chunks serialize like BeautifulSoup."""
+    html = "<div title=\"it's\" data-z=\"1\" class=\"a b\" data-q='say \"hi\"'>" + "<p>Some paragraph text</p>" * 20 + "</div>"
+    opening = str(BeautifulSoup(html, "lxml").div).split("<p>")[0]
+    chunks = split_html_by_dom(html, max_tokens=40)
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert chunk['content'].startswith("<html><body>" + opening)
+
+
+def test_meta_charset_document():
+    """Test documents declaring their charset in <meta> tags can be chunked."""
+    html = (
+        '<html><head><meta charset="ISO-8859-1">'
+        '<meta http-equiv="Content-Type" content="text/html; charset=ISO-8859-1"></head>'
+        '<body>' + '<p>Some paragraph text</p>' * 20 + '</body></html>'
+    )
+    head = str(BeautifulSoup(html, "lxml").head)
+    chunks = split_html_by_dom(html, max_tokens=200)
+
+    assert chunks[0]['content'] == "<html>" + head + "</html>"
+    assert get_html_chunks(html, max_tokens=100)
+
+
+def test_split_matches_exact_counts():
+    """Test splitting descends into exactly the nodes whose serialization is too long."""
+    def exact_split(node, max_tokens, out):
+        if count_tokens(str(node)) < max_tokens:
+            out.append(str(node))
+            return
+        for child in node.find_all(True, recursive=False):
+            exact_split(child, max_tokens, out)
+
+    rng = random.Random(5)
+    words = ["lorem", "ipsum", "w79x", "dolor,", "sit.", "&", "<x>", "(a)", '"q"']
+
+    def element(depth):
+        tag = rng.choice(["p", "div", "span", "section"])
+        inner = " ".join(
+            rng.choice(words) if rng.random() < 0.6 or depth > 3 else element(depth + 1)
+            for _ in range(rng.randint(1, 8))
+        )
+        return f"<{tag}>{inner}</{tag}>"
+
+    for _ in range(30):
+        soup = BeautifulSoup("<html><body>" + "".join(element(0) for _ in range(5)) + "</body></html>", "lxml")
+        max_tokens = rng.randint(30, 200)
+        expected = []
+        exact_split(soup, max_tokens, expected)
+        chunks = split_html_by_dom(str(soup), max_tokens)
+
+        assert len(chunks) == len(expected)
+        for chunk, node_html in zip(chunks, expected):
+            assert node_html in chunk['content']
+
+
+def test_merge_keeps_all_children():
+    """Test merging two chunks keeps every child of the second one."""
+    chunks = ["<div><span>a</span></div>", "<div><b>x</b><i>y</i><u>z</u></div>"]
+    merged = merge_html_chunks(chunks, max_tokens=1000)
+
+    assert merged == ["<div><span>a</span><b>x</b><i>y</i><u>z</u></div>"]
+
+
+def test_list_items_survive_merge():
+    """Test merging list item chunks never drops an item."""
+    html = "<ul>" + "".join(f"<li>Item number {i} here</li>" for i in range(30)) + "</ul>"
+    for max_tokens in (60, 100, 200):
+        merged = "".join(get_html_chunks(html, max_tokens))
+        for i in range(30):
+            assert f"Item number {i} here" in merged
+
+
+def test_merge_respects_limit_with_entities():
+    """Test merged chunks stay under the limit when text needs escaping."""
+    chunks = ["<div><p>x</p></div>"] + [f"<div>{i} " + "a &amp; b &lt; c " * 3 + "</div>" for i in range(20)]
+    for chunk in merge_html_chunks(chunks, max_tokens=120):
+        assert count_tokens(chunk) <= 120
+
+
+def test_merge_never_exceeds_limit():
+    """Test merged chunks fit even where merging changes tokenization at the seams."""
+    rng = random.Random(7)
+    pieces = ["ab", "x", "<br>", "/", ">", "&amp;", "  ", "}}"]
+    for _ in range(200):
+        chunks = [
+            "<div><section><p>" + "".join(rng.choice(pieces) for _ in range(rng.randint(1, 6))) + "</p></section></div>"
+            for _ in range(rng.randint(2, 12))
+        ]
+        max_tokens = rng.randint(20, 80)
+        for chunk in merge_html_chunks(chunks, max_tokens):
+            if chunk not in chunks:
+                assert count_tokens(chunk) <= max_tokens
+
+
+def test_optimal_merge():
+    """Test optimal merging never produces more chunks than greedy merging."""
+    html = "<html><body>" + "".join(f"<p>Paragraph number {i}</p>" for i in range(30)) + "</body></html>"
+    greedy = get_html_chunks(html, max_tokens=80)
+    optimal = get_html_chunks(html, max_tokens=80, optimal_merge=True)
+
+    assert 0 < len(optimal) <= len(greedy)
+    assert all(count_tokens(chunk) <= 80 for chunk in optimal)
+
+
 def test_empty_html():
     """Test chunking with empty HTML."""
     html = ""